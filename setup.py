@@ -0,0 +1,21 @@
+from setuptools import find_packages, setup
+
+setup(
+    name="zoo-cwltool-runner",
+    version="0.1.0",
+    description="ZOO-Project runner executing CWL application packages with cwltool",
+    url="https://github.com/ZOO-Project/zoo-cwltool-runner",
+    author="Terradue",
+    license="Apache-2.0",
+    packages=find_packages(exclude=["tests", "tests.*"]),
+    package_data={"zoo_cwltool_runner": ["assets/*.yaml"]},
+    install_requires=[
+        "attrs",
+        "cwltool",
+        "cwl-utils",
+        "cwl-wrapper",
+        "PyYAML",
+    ],
+    python_requires=">=3.8",
+    zip_safe=False,
+)
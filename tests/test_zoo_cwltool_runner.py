@@ -0,0 +1,149 @@
+import datetime
+import os
+import pathlib
+import unittest
+from unittest import mock
+
+import yaml
+from zoo_cwltool_runner import (
+    ResourceRequirement,
+    Workflow,
+    ZooCwltoolRunner,
+    ZooInputs,
+    ZooOutputs,
+    _detect_podman,
+)
+
+
+class TestZooCwltoolRunner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app_package = (
+            pathlib.Path(os.path.realpath(__file__)).parent
+            / "water_bodies"
+            / "app-package.cwl"
+        )
+        with open(app_package) as stream:
+            cls.cwl = yaml.safe_load(stream)
+        cls.workflow = Workflow(cls.cwl, "water_bodies")
+
+    def test_get_workflow(self):
+        workflow = self.workflow.get_workflow()
+        self.assertEqual(workflow.id.split("#")[-1], "water_bodies")
+
+    def test_get_object_by_id(self):
+        crop = self.workflow.get_object_by_id("crop")
+        self.assertEqual(crop.id.split("#")[-1], "crop")
+
+    def test_get_workflow_inputs(self):
+        inputs = self.workflow.get_workflow_inputs()
+        self.assertEqual(sorted(inputs), ["aoi", "epsg", "stac_items"])
+
+    def test_get_mandatory_workflow_inputs(self):
+        # epsg has a default value, it is not mandatory
+        inputs = self.workflow.get_workflow_inputs(mandatory=True)
+        self.assertEqual(sorted(inputs), ["aoi", "stac_items"])
+
+    def test_has_scatter_requirement(self):
+        self.assertTrue(
+            self.workflow.has_scatter_requirement(self.workflow.get_workflow())
+        )
+
+    def test_eval_resource(self):
+        resources = self.workflow.eval_resource()
+        self.assertIn(512, resources["ramMax"])
+        self.assertIn(1, resources["coresMax"])
+
+    def test_eval_resource_scalar_scatter(self):
+        # every tool declares coresMax: 1; a scalar scatter entry must not
+        # multiply it by the length of the scatter URI string
+        resources = self.workflow.eval_resource()
+        self.assertEqual(max(resources["coresMax"]), 1)
+
+    def test_workflow_with_date_metadata(self):
+        # YAML parses schema.org date annotations to datetime.date; the
+        # document cache key must accept them
+        cwl = dict(self.cwl)
+        cwl["s:dateCreated"] = datetime.date(2020, 6, 1)
+        workflow = Workflow(cwl, "water_bodies")
+        self.assertEqual(workflow.get_workflow().id.split("#")[-1], "water_bodies")
+
+    def test_resource_requirement_from_dict(self):
+        resource_requirement = ResourceRequirement.from_dict(
+            {"class": "ResourceRequirement", "coresMax": 2, "ramMax": 1024}
+        )
+        self.assertEqual(resource_requirement.coresMax, 2)
+        self.assertEqual(resource_requirement.ramMax, 1024)
+        self.assertIsNone(resource_requirement.coresMin)
+
+    def test_shorten_namespace(self):
+        value = "water-bodies-" + "a" * 80
+        shortened = ZooCwltoolRunner.shorten_namespace(value)
+        self.assertLessEqual(len(shortened), 63)
+        self.assertFalse(shortened.endswith("-"))
+
+    def test_shorten_namespace_short_value(self):
+        self.assertEqual(
+            ZooCwltoolRunner.shorten_namespace("water-bodies"), "water-bodies"
+        )
+
+    def test_get_max_cores(self):
+        # every tool claims coresMax: 1; the executor budget must still be
+        # the host core count so scatter jobs run concurrently
+        with mock.patch("zoo_cwltool_runner._detect_podman", return_value=False):
+            runner = ZooCwltoolRunner(
+                cwl=self.cwl,
+                conf={"lenv": {"Identifier": "water_bodies"}, "main": {"tmpPath": "/tmp"}},
+                inputs={},
+                outputs={},
+            )
+        self.assertEqual(runner.get_max_cores(), os.cpu_count() or 1)
+
+    def test_detect_podman(self):
+        _detect_podman.cache_clear()
+        try:
+            with mock.patch("zoo_cwltool_runner.which", side_effect=["/bin/podman"]):
+                self.assertTrue(_detect_podman())
+            _detect_podman.cache_clear()
+            with mock.patch(
+                "zoo_cwltool_runner.which", side_effect=[None, "/bin/docker"]
+            ):
+                self.assertFalse(_detect_podman())
+            _detect_podman.cache_clear()
+            with mock.patch("zoo_cwltool_runner.which", side_effect=[None, None]):
+                with self.assertRaises(ValueError):
+                    _detect_podman()
+        finally:
+            _detect_podman.cache_clear()
+
+
+class TestZooInputs(unittest.TestCase):
+    def test_get_processing_parameters(self):
+        inputs = ZooInputs({"aoi": {"value": "-121.399,39.834,-120.74,40.472"}})
+        self.assertEqual(
+            inputs.get_processing_parameters(),
+            {"aoi": "-121.399,39.834,-120.74,40.472"},
+        )
+
+    def test_max_occurs_conversion(self):
+        inputs = ZooInputs({"stac_items": {"maxOccurs": "2", "value": "item"}})
+        self.assertEqual(inputs.get_input_value("stac_items"), ["item"])
+
+    def test_get_input_value_missing_key(self):
+        inputs = ZooInputs({"aoi": {"value": "a value"}})
+        with self.assertRaises(ValueError):
+            inputs.get_input_value("missing")
+
+
+class TestZooOutputs(unittest.TestCase):
+    def test_set_output(self):
+        outputs = ZooOutputs({"stac": {"value": ""}})
+        outputs.set_output({"stac_catalog": {"class": "Directory"}})
+        self.assertEqual(
+            outputs.get_output_parameters(),
+            {"stac": {"stac_catalog": {"class": "Directory"}}},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
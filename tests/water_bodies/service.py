@@ -0,0 +1,64 @@
+import copy
+import functools
+import json
+import os
+import pathlib
+
+import yaml
+from zoo_cwltool_runner import ZooCwltoolRunner
+from zoo_cwltool_runner.handlers import CwltoolRunnerExecutionHandler
+
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+try:
+    import zoo
+except ImportError:
+
+    class ZooStub(object):
+        def __init__(self):
+            self.SERVICE_SUCCEEDED = 3
+            self.SERVICE_FAILED = 4
+
+        def update_status(self, conf, progress):
+            print(f"Status {progress}")
+
+        def _(self, message):
+            print(f"invoked _ with {message}")
+
+    zoo = ZooStub()
+
+
+_APP_PACKAGE = pathlib.Path(__file__).resolve().parent / "app-package.cwl"
+
+
+@functools.lru_cache(maxsize=8)
+def _load_cwl(path, mtime):
+    """Parses the app package, memoized until the file changes on disk"""
+    with path.open() as stream:
+        return yaml.load(stream, Loader=_Loader)
+
+
+def water_bodies(conf, inputs, outputs):
+    # hand the runner a copy: cwl_wrapper mutates the document in place,
+    # and the cached dict is shared across requests
+    cwl = copy.deepcopy(_load_cwl(_APP_PACKAGE, os.path.getmtime(_APP_PACKAGE)))
+
+    runner = ZooCwltoolRunner(
+        cwl=cwl,
+        conf=conf,
+        inputs=inputs,
+        outputs=outputs,
+        execution_handler=CwltoolRunnerExecutionHandler(conf=conf),
+    )
+
+    exit_status = runner.execute()
+
+    if exit_status == zoo.SERVICE_SUCCEEDED:
+        outputs["stac"]["value"] = json.dumps(runner.outputs.outputs["stac"]["value"])
+        return zoo.SERVICE_SUCCEEDED
+
+    conf["lenv"]["message"] = zoo._("Execution failed")
+    return zoo.SERVICE_FAILED
@@ -0,0 +1,593 @@
+import argparse
+import functools
+import json
+import logging
+import operator
+import os
+import secrets
+import tempfile
+import time
+import traceback
+from shutil import which
+from typing import Union
+
+import attr
+import yaml
+
+from zoo_cwltool_runner.handlers import ExecutionHandler
+
+# cwltool, cwl_utils and cwl_wrapper each pull in dozens of modules and
+# dominate cold-start time; they are imported lazily where needed so the
+# short-circuit failure paths stay cheap
+logger = logging.getLogger(__name__)
+
+# coalescing window for progress updates, in seconds; each update is an IPC
+# round-trip to the ZOO kernel
+_STATUS_INTERVAL = 0.1
+
+try:
+    from yaml import CSafeDumper as _Dumper
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    # PyYAML built without libyaml, fall back to the pure-Python implementation
+    from yaml import SafeDumper as _Dumper
+    from yaml import SafeLoader as _Loader
+
+@functools.lru_cache(maxsize=1)
+def _scatter_reqs():
+    import cwl_utils.parser
+
+    return (
+        cwl_utils.parser.cwl_v1_0.ScatterFeatureRequirement,
+        cwl_utils.parser.cwl_v1_1.ScatterFeatureRequirement,
+        cwl_utils.parser.cwl_v1_2.ScatterFeatureRequirement,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _resource_reqs():
+    import cwl_utils.parser
+
+    return (
+        cwl_utils.parser.cwl_v1_0.ResourceRequirement,
+        cwl_utils.parser.cwl_v1_1.ResourceRequirement,
+        cwl_utils.parser.cwl_v1_2.ResourceRequirement,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _workflow_types():
+    import cwl_utils.parser
+
+    return (
+        cwl_utils.parser.cwl_v1_0.Workflow,
+        cwl_utils.parser.cwl_v1_1.Workflow,
+        cwl_utils.parser.cwl_v1_2.Workflow,
+    )
+
+# wrapper assets, resolved once at import; the WRAPPER_* variables allow a
+# deployment to point at its own stage-in/out definitions
+_ASSETS = os.path.join(os.path.dirname(__file__), "assets")
+_STAGE_IN = os.environ.get("WRAPPER_STAGE_IN", os.path.join(_ASSETS, "stagein.yaml"))
+_STAGE_OUT = os.environ.get("WRAPPER_STAGE_OUT", os.path.join(_ASSETS, "stageout.yaml"))
+_MAIN_CWL = os.environ.get("WRAPPER_MAIN", os.path.join(_ASSETS, "main.yaml"))
+_RULES = os.environ.get("WRAPPER_RULES", os.path.join(_ASSETS, "rules.yaml"))
+
+@functools.lru_cache(maxsize=1)
+def _detect_podman() -> bool:
+    """True for podman, False for docker; cached, the engine does not change
+    within a service process"""
+    if which("podman") is not None:
+        return True
+    if which("docker") is not None:
+        return False
+    raise ValueError("No container engine found, install podman or docker")
+
+
+_RESOURCE_KEYS = (
+    "coresMin",
+    "coresMax",
+    "ramMin",
+    "ramMax",
+    "tmpdirMin",
+    "tmpdirMax",
+    "outdirMin",
+    "outdirMax",
+)
+
+# fetches all resource fields in one C-level call
+_RESOURCE_GETTER = operator.attrgetter(*_RESOURCE_KEYS)
+
+try:
+    import zoo
+except ImportError:
+
+    class ZooStub(object):
+        def __init__(self):
+            self.SERVICE_SUCCEEDED = 3
+            self.SERVICE_FAILED = 4
+
+        def update_status(self, conf, progress):
+            print(f"Status {progress}")
+
+        def _(self, message):
+            print(f"invoked _ with {message}")
+
+    zoo = ZooStub()
+
+
+# useful class for CWL hints
+@attr.s
+class ResourceRequirement:
+    coresMin = attr.ib(default=None)
+    coresMax = attr.ib(default=None)
+    ramMin = attr.ib(default=None)
+    ramMax = attr.ib(default=None)
+    tmpdirMin = attr.ib(default=None)
+    tmpdirMax = attr.ib(default=None)
+    outdirMin = attr.ib(default=None)
+    outdirMax = attr.ib(default=None)
+
+    @classmethod
+    def from_dict(cls, env):
+        return cls(**{k: v for k, v in env.items() if k in _RR_FIELDS})
+
+
+_RR_FIELDS = frozenset(field.name for field in attr.fields(ResourceRequirement))
+
+
+class ZooConf:
+    def __init__(self, conf):
+        self.conf = conf
+        self.workflow_id = self.conf["lenv"]["Identifier"]
+
+
+class ZooInputs:
+    def __init__(self, inputs):
+        # this conversion is necessary because the ZOO-Project kernel
+        # converts arrays of length 1 to a string
+        for inp in inputs:
+            if (
+                "maxOccurs" in inputs[inp].keys()
+                and int(inputs[inp]["maxOccurs"]) > 1
+                and not isinstance(inputs[inp]["value"], list)
+            ):
+                inputs[inp]["value"] = [inputs[inp]["value"]]
+
+        self.inputs = inputs
+        self._processing = {
+            key: value["value"] for key, value in inputs.items() if "value" in value
+        }
+
+    def get_input_value(self, key):
+        try:
+            return self.inputs[key]["value"]
+        except (KeyError, TypeError):
+            raise ValueError(f"Key {key} not found in inputs")
+
+    def set(self, key, value):
+        """sets an input value, keeping the cached parameters in sync"""
+        self.inputs.setdefault(key, {})["value"] = value
+        self._processing[key] = value
+
+    def get_processing_parameters(self):
+        """Returns a dict with the input parameter key/values"""
+        return self._processing
+
+
+class ZooOutputs:
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self._output_parameters = {
+            key: value["value"] for key, value in outputs.items() if "value" in value
+        }
+
+    def get_output_parameters(self):
+        """Returns a dict with the output parameter key/values"""
+        return self._output_parameters
+
+    def set_output(self, value):
+        """set the output result value"""
+        if "stac" in self.outputs.keys():
+            self.outputs["stac"]["value"] = value
+            self._output_parameters["stac"] = value
+
+
+@functools.lru_cache(maxsize=32)
+def _load_cwl_document(blob):
+    """Parses and schema-validates a CWL document, memoized on its content so
+    repeated submissions of the same workflow skip the validation pass
+
+    The key is the YAML serialization: unlike JSON it round-trips the
+    date-typed scalars a CWL document may carry (e.g. s:dateCreated).
+    """
+    from cwl_utils.parser import load_document_by_yaml
+
+    return load_document_by_yaml(
+        yaml=yaml.load(blob, Loader=_Loader), uri="io://", load_all=True
+    )
+
+
+class Workflow:
+    def __init__(self, cwl, workflow_id):
+        self.raw_cwl = cwl
+        self.cwl = _load_cwl_document(yaml.dump(cwl, Dumper=_Dumper))
+        self.workflow_id = workflow_id
+        self._by_id = {elem.id.rpartition("#")[2]: elem for elem in self.cwl}
+
+    def get_workflow(self):
+        """Returns the CWL Workflow object with the workflow id entry point"""
+        return self._by_id[self.workflow_id]
+
+    def get_object_by_id(self, id):
+        """Returns the CWL object with the given id"""
+        return self._by_id[id]
+
+    def get_workflow_inputs(self, mandatory=False):
+        """Returns the CWL workflow inputs"""
+        inputs = []
+        for inp in self.get_workflow().inputs:
+            if mandatory:
+                if inp.default is not None:
+                    continue
+                if isinstance(inp.type_, list) and "null" in inp.type_:
+                    continue
+                inputs.append(inp.id.rpartition("/")[2])
+            else:
+                inputs.append(inp.id.rpartition("/")[2])
+        return inputs
+
+    @staticmethod
+    def has_scatter_requirement(workflow):
+        """Checks if the workflow uses the CWL scatter feature"""
+        scatter_reqs = _scatter_reqs()
+        return workflow.requirements is not None and any(
+            isinstance(requirement, scatter_reqs)
+            for requirement in workflow.requirements
+        )
+
+    @staticmethod
+    def get_resource_requirement(elem):
+        """Gets the ResourceRequirement out of a CWL element
+
+        Args:
+            elem (CWL element): a CWL element, either a Workflow or a CommandLineTool
+
+        Returns:
+            the ResourceRequirement, from the requirements or the hints
+        """
+        if elem.requirements is not None:
+            resource_reqs = _resource_reqs()
+            resource_requirement = [
+                requirement
+                for requirement in elem.requirements
+                if isinstance(requirement, resource_reqs)
+            ]
+
+            if len(resource_requirement) == 1:
+                return resource_requirement[0]
+
+        if elem.hints is not None:
+            resource_requirement = [
+                ResourceRequirement.from_dict(hint)
+                for hint in elem.hints
+                if hint["class"] == "ResourceRequirement"
+            ]
+
+            if len(resource_requirement) == 1:
+                return resource_requirement[0]
+
+    def eval_resource(self):
+        """Evaluates the resource requirements of the workflow and its steps"""
+        resources = {resource_type: [] for resource_type in _RESOURCE_KEYS}
+        workflow_types = _workflow_types()
+
+        for elem in self.cwl:
+            if isinstance(elem, workflow_types):
+                if resource_requirement := self.get_resource_requirement(elem):
+                    for resource_type, value in zip(
+                        _RESOURCE_KEYS, _RESOURCE_GETTER(resource_requirement)
+                    ):
+                        if value:
+                            resources[resource_type].append(value)
+                scatter = self.has_scatter_requirement(elem)
+                for step in elem.steps:
+                    if resource_requirement := self.get_resource_requirement(
+                        self.get_object_by_id(step.run[1:])
+                    ):
+                        # a scalar scatter entry is parsed as a URI string by
+                        # cwl-utils, only a list scatters over several inputs
+                        multiplier = (
+                            len(step.scatter)
+                            if scatter and isinstance(step.scatter, list)
+                            else 1
+                        )
+                        for resource_type, value in zip(
+                            _RESOURCE_KEYS, _RESOURCE_GETTER(resource_requirement)
+                        ):
+                            if value:
+                                resources[resource_type].append(value * multiplier)
+
+        return resources
+
+
+class ZooCwltoolRunner:
+    def __init__(
+        self,
+        cwl,
+        conf,
+        inputs,
+        outputs,
+        execution_handler: Union[ExecutionHandler, None] = None,
+    ):
+        self.zoo_conf = ZooConf(conf)
+        self.inputs = ZooInputs(inputs)
+        self.outputs = ZooOutputs(outputs)
+        self.cwl = Workflow(cwl, self.zoo_conf.workflow_id)
+        self.handler = execution_handler
+        self._last_status = 0.0
+
+        self.podman = _detect_podman()
+
+    @staticmethod
+    def shorten_namespace(value: str) -> str:
+        """shortens the namespace to 63 characters"""
+        return value[:63].rstrip("-") if len(value) > 63 else value
+
+    def get_job_id(self) -> str:
+        """creates a sanitized job identifier for the execution"""
+        return self.shorten_namespace(
+            f"{str(self.zoo_conf.workflow_id).replace('_', '-')}-"
+            f"{time.time_ns()}-{secrets.token_hex(8)}"
+        )
+
+    def update_status(
+        self, progress: int, message: str = None, flush: bool = False
+    ) -> None:
+        """updates the execution progress (%) and provides an optional message
+
+        Updates landing within _STATUS_INTERVAL of the previous emit are
+        coalesced: the message is kept and delivered with the next update,
+        sparing one kernel IPC round-trip. The final update (100%) and
+        updates with flush=True are always emitted; flush is used before
+        long-running calls so the pending state reaches the kernel.
+        """
+        if message is not None:
+            self.zoo_conf.conf["lenv"]["message"] = message
+
+        now = time.monotonic()
+        if (
+            not flush
+            and progress < 100
+            and now - self._last_status < _STATUS_INTERVAL
+        ):
+            return
+
+        self._last_status = now
+        zoo.update_status(self.zoo_conf.conf, progress)
+
+    def get_workflow_id(self):
+        """returns the workflow id (CWL entry point)"""
+        return self.zoo_conf.workflow_id
+
+    def get_processing_parameters(self):
+        """Gets the processing parameters from the zoo inputs"""
+        return self.inputs.get_processing_parameters()
+
+    def get_workflow_inputs(self, mandatory=False):
+        """Returns the CWL workflow inputs"""
+        return self.cwl.get_workflow_inputs(mandatory=mandatory)
+
+    def get_max_cores(self) -> int:
+        """returns the total core budget for the executor
+
+        MultithreadedJobExecutor accounts each job's own core claim against
+        this budget, so it is the host CPU count — capping it to the largest
+        per-step claim would serialize single-core scatter jobs. It is only
+        raised when a step claims more than the host has, so that step stays
+        schedulable.
+        """
+        cores = self.cwl.eval_resource()["coresMax"]
+        host_cores = os.cpu_count() or 1
+        return max(int(max(cores)), host_cores) if cores else host_cores
+
+    def assert_parameters(self):
+        """checks all mandatory processing parameters were provided"""
+        return set(self.get_workflow_inputs(mandatory=True)).issubset(
+            self.get_processing_parameters().keys()
+        )
+
+    def execute(self) -> int:
+        if not (self.assert_parameters()):
+            logger.error("Mandatory parameters missing")
+            return zoo.SERVICE_FAILED
+
+        logger.info("execution started")
+        self.update_status(progress=3, message="execution started")
+
+        processing_parameters = {
+            **self.get_processing_parameters(),
+            **self.handler.get_additional_parameters(),
+        }
+
+        logger.info("wrap the CWL workflow with the stage-in/out steps")
+        wrapped_workflow = self.wrap()
+        self.update_status(progress=10, message="workflow wrapped")
+
+        job_id = self.get_job_id()
+        self.handler.set_job_id(job_id=job_id)
+        logger.info("job id: %s", job_id)
+
+        self.update_status(progress=15, message="pre-execution hook")
+        self.handler.pre_execution_hook()
+
+        # flush: the execution may run for hours, make sure the last
+        # pre-execution state is delivered before it starts
+        self.update_status(progress=20, message="execution submitted", flush=True)
+
+        # spill to disk past 1MiB so large execution logs are not held
+        # twice in memory
+        stream_err = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode="w+")
+
+        logger.info("execution")
+        if os.environ.get("ZOO_CWLTOOL_FILE_MODE", "false").lower() in ("1", "true"):
+            exit_status, output = self._run_with_files(
+                wrapped_workflow, processing_parameters, job_id, stream_err
+            )
+        else:
+            exit_status, output = self._run_in_process(
+                wrapped_workflow, processing_parameters, job_id, stream_err
+            )
+
+        if exit_status == 0:
+            logger.info("execution successful")
+            exit_value = zoo.SERVICE_SUCCEEDED
+            self.outputs.set_output(output)
+        else:
+            logger.error("execution failed")
+            exit_value = zoo.SERVICE_FAILED
+
+        self.update_status(progress=90, message="delivering outputs and logs")
+
+        logger.info("handle execution outputs and logs")
+        stream_err.seek(0)
+        self.handler.handle_outputs(
+            log=stream_err,
+            output=output,
+            usage_report=None,
+            tool_logs=None,
+        )
+        stream_err.close()
+
+        self.update_status(progress=97, message="post-execution hook")
+        self.handler.post_execution_hook()
+
+        self.update_status(
+            progress=100,
+            message=f'execution {"failed" if exit_value == zoo.SERVICE_FAILED else "successful"}',
+        )
+
+        return exit_value
+
+    def _run_in_process(self, wrapped_workflow, processing_parameters, job_id, stream_err):
+        """runs the wrapped workflow with the cwltool Python API
+
+        The workflow and the parameters are passed in memory, skipping the
+        temp file round-trip and the YAML re-parse done by the command line
+        entry point.
+        """
+        from cwltool.context import RuntimeContext
+        from cwltool.executors import MultithreadedJobExecutor
+        from cwltool.factory import Factory
+
+        outdir = os.path.join(self.zoo_conf.conf["main"]["tmpPath"], job_id)
+
+        # the in-memory document needs a base URI so that cwltool can
+        # resolve the #main entry point of the $graph; the file is never
+        # written
+        wrapped_workflow = dict(wrapped_workflow)
+        wrapped_workflow["id"] = f"file://{outdir}.cwl"
+
+        runtime_context = RuntimeContext()
+        runtime_context.outdir = outdir
+        runtime_context.podman = self.podman
+
+        # the executor accounts each job's core claim against this total
+        # budget, bounding scatter-heavy executions without serializing them
+        factory = Factory(
+            executor=MultithreadedJobExecutor(max_parallel=self.get_max_cores()),
+            runtime_context=runtime_context,
+        )
+
+        # route the cwltool logs to the execution log stream
+        log_handler = logging.StreamHandler(stream_err)
+        cwltool_logger = logging.getLogger("cwltool")
+        cwltool_logger.addHandler(log_handler)
+
+        try:
+            tool = factory.make(wrapped_workflow)
+            return 0, tool(**processing_parameters)
+        except Exception:
+            # not everything surfaces on the cwltool logger (e.g. document
+            # validation errors raised by factory.make); write the traceback
+            # into the execution log the handler delivers to the user
+            logger.exception("execution failed")
+            traceback.print_exc(file=stream_err)
+            return 1, {}
+        finally:
+            cwltool_logger.removeHandler(log_handler)
+
+    def _run_with_files(self, wrapped_workflow, processing_parameters, job_id, stream_err):
+        """runs the wrapped workflow with the cwltool command line entry point
+
+        Debugging fallback enabled with ZOO_CWLTOOL_FILE_MODE, the workflow
+        and the parameters go through temp files in the current directory.
+        """
+        from cwltool.executors import MultithreadedJobExecutor
+        from cwltool.main import main
+
+        tmp_path = self.zoo_conf.conf["main"]["tmpPath"]
+
+        # unique names under tmpPath so concurrent executions cannot race
+        # on the temp files
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=tmp_path, suffix=".cwl", delete=False
+        ) as tcwl:
+            tcwl.write(yaml.dump(wrapped_workflow, Dumper=_Dumper))
+            cwl_path = tcwl.name
+
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=tmp_path, suffix=".yaml", delete=False
+        ) as tparams:
+            tparams.write(yaml.dump(processing_parameters, Dumper=_Dumper))
+            params_path = tparams.name
+
+        stream_out = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode="w+")
+
+        parsed_args = argparse.Namespace(
+            podman=self.podman,
+            parallel=True,
+            debug=False,
+            outdir=os.path.join(tmp_path, job_id),
+            workflow=f"{cwl_path}#main",
+            job_order=[params_path],
+        )
+
+        try:
+            exit_status = main(
+                args=parsed_args,
+                stdout=stream_out,
+                stderr=stream_err,
+                executor=MultithreadedJobExecutor(max_parallel=self.get_max_cores()),
+            )
+
+            if exit_status == 0:
+                stream_out.seek(0)
+                output = json.load(stream_out)
+            else:
+                output = {}
+        finally:
+            stream_out.close()
+            os.unlink(cwl_path)
+            os.unlink(params_path)
+
+        return exit_status, output
+
+    def wrap(self):
+        """wraps the user CWL workflow with the stage-in/out steps"""
+        from cwl_wrapper.parser import Parser
+
+        workflow_id = self.zoo_conf.workflow_id
+
+        wf = Parser(
+            cwl=self.cwl.raw_cwl,
+            output=None,
+            stagein=_STAGE_IN,
+            stageout=_STAGE_OUT,
+            maincwl=_MAIN_CWL,
+            rulez=_RULES,
+            assets=None,
+            workflow_id=workflow_id,
+        )
+
+        return wf.out
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+
+
+class ExecutionHandler(ABC):
+    def __init__(self, conf=None):
+        self.conf = conf
+        self.job_id = None
+
+    def set_job_id(self, job_id):
+        self.job_id = job_id
+
+    @abstractmethod
+    def pre_execution_hook(self):
+        pass
+
+    @abstractmethod
+    def post_execution_hook(self):
+        pass
+
+    @abstractmethod
+    def get_additional_parameters(self):
+        pass
+
+    @abstractmethod
+    def handle_outputs(self, log, output, usage_report, tool_logs):
+        pass
+
+
+class CwltoolRunnerExecutionHandler(ExecutionHandler):
+    """Default handler storing the execution log and outputs under the ZOO tmpPath"""
+
+    def pre_execution_hook(self):
+        pass
+
+    def post_execution_hook(self):
+        pass
+
+    def get_additional_parameters(self):
+        return {}
+
+    def handle_outputs(self, log, output, usage_report, tool_logs):
+        """Stores the cwltool execution log and the output manifest
+
+        Args:
+            log: file object positioned at the start of the execution log
+        """
+        tmp_path = self.conf["main"]["tmpPath"]
+
+        with open(
+            os.path.join(tmp_path, f"{self.job_id}.log"), "w", buffering=1 << 16
+        ) as f:
+            shutil.copyfileobj(log, f, length=1 << 16)
+
+        # the manifest is consumed by tooling, write the compact form;
+        # ensure_ascii=False keeps UTF-8 content unescaped
+        with open(
+            os.path.join(tmp_path, f"{self.job_id}_output.json"),
+            "w",
+            buffering=1 << 16,
+        ) as output_file:
+            output_file.write(
+                json.dumps(output, separators=(",", ":"), ensure_ascii=False)
+            )
+
+        if os.environ.get("DEBUG"):
+            with open(
+                os.path.join(tmp_path, f"{self.job_id}_output.pretty.json"), "w"
+            ) as pretty_file:
+                pretty_file.write(json.dumps(output, indent=4, ensure_ascii=False))